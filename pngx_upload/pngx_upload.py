@@ -6,50 +6,148 @@ This script downloads the fhswf German handwriting dataset from Hugging Face
 and uploads each handwriting sample as a document to a running Paperless-NGX instance.
 
 Requirements:
-- pip install datasets pillow requests
+- pip install datasets pillow requests requests-toolbelt 'httpx[http2]' aiolimiter
 - A running Paperless-NGX instance
 - Valid API token for Paperless-NGX
 
 Author: Generated for neuroscience consultant workflow
 """
 
+import io
 import os
 import sys
+import asyncio
+import httpx
+from aiolimiter import AsyncLimiter
 import requests
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datasets import load_dataset
 from PIL import Image
-import tempfile
 import uuid
-import time
 import json
-from typing import Optional, Dict, Any
+import hashlib
+import multiprocessing
+import shelve
+import time
+import queue
+import threading
+from typing import Optional, Dict, Any, Tuple, List, Set, BinaryIO, Iterable, Iterator
 import argparse
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from itertools import islice
+
+# Local record of uploaded JPEG digests, used to skip re-uploads on later runs
+UPLOAD_CACHE_PATH = '.pngx_cache.db'
+
+# Write-ahead log of failed uploads, replayed with --retry-wal
+WAL_DIR = 'pngx_wal'
+WAL_QUEUE = 'queue.jsonl'
+
+# Seconds a successful connection test stays valid
+CONNECTION_CHECK_TTL = 60
+
+# Retry policy shared by the requests session and the async upload path
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 502, 503, 504)
+
+def _retry_delay(retry_after: Optional[str], attempt: int) -> float:
+    """Seconds to wait before a retry, preferring the server's Retry-After header"""
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return RETRY_BACKOFF_FACTOR * (2 ** attempt)
+
+def _rate_limiter(rps_limit: Optional[float]) -> Optional[AsyncLimiter]:
+    """Limiter allowing one request every 1/rps_limit seconds, or None when unlimited"""
+    # A bucket smaller than one token makes every acquire() raise, so
+    # fractional rates stretch the period instead of shrinking the bucket
+    return AsyncLimiter(1, 1 / rps_limit) if rps_limit else None
+
+def _task_results(data: Any) -> List[Dict[str, Any]]:
+    """Task list from a /api/tasks/ response, which may be paginated or a plain list"""
+    return data.get('results', []) if isinstance(data, dict) else data
 
 class PaperlessNGXUploader:
     """Handle uploads to Paperless-NGX via REST API"""
 
-    def __init__(self, paperless_url: str, token: str):
+    def __init__(self, paperless_url: str, token: str, max_connections: int = 16):
         """
         Initialize the Paperless-NGX uploader
 
         Args:
             paperless_url: Base URL of your Paperless-NGX instance
             token: API token for authentication
+            max_connections: Connection pool size for the async upload client
         """
         self.paperless_url = paperless_url.rstrip('/')
         self.token = token
         self.headers = {
             'Authorization': f'Token {token}'
         }
+        self.documents_endpoint = f"{self.paperless_url}/api/documents/"
         self.upload_endpoint = f"{self.paperless_url}/api/documents/post_document/"
         self.tasks_endpoint = f"{self.paperless_url}/api/tasks/"
+        # Creation date sent with every upload, formatted once per uploader
+        self._today = datetime.now().strftime('%Y-%m-%d')
+        # time.monotonic() of the last successful connection test
+        self._last_ok_ts = float('-inf')
+
+        # Reuse one pooled session so TCP/TLS connections survive across uploads.
+        # Uploads stream their body and can't be replayed by urllib3, so
+        # upload_document retries POSTs itself with the same policy.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=RETRY_TOTAL,
+                backoff_factor=RETRY_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                respect_retry_after_header=True,
+                allowed_methods=frozenset(['GET', 'HEAD'])
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Async uploads go through an HTTP/2 client, created on first use
+        self.max_connections = max_connections
+        self.aclient: Optional[httpx.AsyncClient] = None
+
+    def close(self):
+        """Close the underlying HTTP session and its pooled connections"""
+        self.session.close()
 
     def test_connection(self) -> bool:
-        """Test the connection to Paperless-NGX"""
+        """
+        Test the connection to Paperless-NGX
+
+        A successful check is cached for CONNECTION_CHECK_TTL seconds, so
+        repeated calls on the same uploader don't re-hit the API.
+        """
+        if time.monotonic() - self._last_ok_ts < CONNECTION_CHECK_TTL:
+            return True
         try:
-            response = requests.get(f"{self.paperless_url}/api/", headers=self.headers)
+            # HEAD skips the JSON body Paperless-NGX returns for the API root.
+            # Unlike GET it doesn't follow redirects by default (http→https,
+            # proxy prefixes), so ask for that explicitly.
+            response = self.session.head(f"{self.paperless_url}/api/", allow_redirects=True)
             if response.status_code == 200:
+                self._last_ok_ts = time.monotonic()
                 print("✓ Successfully connected to Paperless-NGX")
                 return True
             else:
@@ -59,14 +157,16 @@ class PaperlessNGXUploader:
             print(f"✗ Connection error: {str(e)}")
             return False
 
-    def upload_document(self, file_path: str, title: str, text_content: str = None, 
-                       tags: list = None, document_type: int = None, 
+    def upload_document(self, file_obj: BinaryIO, filename: str, title: str,
+                       text_content: str = None, tags: list = None,
+                       document_type: int = None,
                        correspondent: int = None) -> Optional[Dict[str, Any]]:
         """
         Upload a document to Paperless-NGX
 
         Args:
-            file_path: Path to the document file
+            file_obj: Seekable binary file-like object holding the document (e.g. io.BytesIO)
+            filename: Filename reported to Paperless-NGX
             title: Title for the document
             text_content: Optional text content description
             tags: Optional list of tag IDs
@@ -77,51 +177,134 @@ class PaperlessNGXUploader:
             Response data if successful, None otherwise
         """
         try:
-            # Prepare the file for upload
-            with open(file_path, 'rb') as file:
-                # Determine content type based on file extension
-                content_type = 'image/jpeg'
-                if file_path.lower().endswith('.png'):
-                    content_type = 'image/png'
-                elif file_path.lower().endswith('.pdf'):
-                    content_type = 'application/pdf'
+            # Determine content type based on file extension
+            content_type = 'image/jpeg'
+            if filename.lower().endswith('.png'):
+                content_type = 'image/png'
+            elif filename.lower().endswith('.pdf'):
+                content_type = 'application/pdf'
 
-                files = {
-                    'document': (os.path.basename(file_path), file, content_type)
-                }
+            # Prepare form data as pairs so repeated keys survive
+            fields = [
+                ('title', title),
+                ('created', self._today)
+            ]
 
-                # Prepare form data
-                data = {
-                    'title': title,
-                    'created': datetime.now().strftime('%Y-%m-%d')
-                }
+            # Add optional fields
+            if document_type:
+                fields.append(('document_type', str(document_type)))
+            if correspondent:
+                fields.append(('correspondent', str(correspondent)))
+            if tags:
+                # Tags are sent as one 'tags' field per tag ID
+                fields.extend(('tags', str(tag)) for tag in tags)
+            fields.append(('document', (filename, file_obj, content_type)))
 
-                # Add optional fields
-                if document_type:
-                    data['document_type'] = str(document_type)
-                if correspondent:
-                    data['correspondent'] = str(correspondent)
-                if tags:
-                    # Tags can be specified multiple times
-                    for tag in tags:
-                        data['tags'] = str(tag)
+            for attempt in range(RETRY_TOTAL + 1):
+                # The encoder streams the file in a single pass, so it is
+                # rebuilt from the start of the file per attempt
+                file_obj.seek(0)
+                encoder = MultipartEncoder(fields=fields)
 
                 # Make the upload request
-                response = requests.post(
+                response = self.session.post(
                     self.upload_endpoint,
-                    headers=self.headers,
-                    files=files,
-                    data=data,
+                    data=encoder,
+                    headers={'Content-Type': encoder.content_type},
                     timeout=30
                 )
 
                 if response.status_code == 200:
                     result = response.json()
                     return result
-                else:
+                if response.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                    print(f"Upload failed: {response.status_code} - {response.text}")
+                    return None
+                time.sleep(_retry_delay(response.headers.get('Retry-After'), attempt))
+
+        except Exception as e:
+            print(f"Error uploading document: {str(e)}")
+            return None
+
+    def _async_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP/2 client for async uploads, creating it on first use"""
+        if self.aclient is None or self.aclient.is_closed:
+            self.aclient = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=30.0,
+                headers=self.headers
+            )
+        return self.aclient
+
+    async def aclose(self):
+        """Close the async HTTP client, if one was opened"""
+        if self.aclient is not None:
+            await self.aclient.aclose()
+            self.aclient = None
+
+    async def _upload_one(self, sem: asyncio.Semaphore, file_obj: BinaryIO,
+                          filename: str, title: str, tags: list = None,
+                          document_type: int = None, correspondent: int = None,
+                          limiter: Optional[AsyncLimiter] = None) -> Optional[Dict[str, Any]]:
+        """
+        Async counterpart of upload_document, bounded by a shared semaphore
+
+        Uploads share one HTTP/2 connection where the server supports it.
+        Overload responses (429/502/503/504) are retried with the same policy
+        as upload_document, honouring the server's Retry-After header.
+
+        Args:
+            sem: Semaphore limiting the number of in-flight uploads
+            file_obj: Seekable binary file-like object holding the JPEG data
+            filename: Filename reported to Paperless-NGX
+            title: Title for the document
+            tags: Optional list of tag IDs
+            document_type: Optional document type ID
+            correspondent: Optional correspondent ID
+            limiter: Optional rate limiter shared across the whole run
+
+        Returns:
+            Response data if successful, None otherwise
+        """
+        try:
+            client = self._async_client()
+
+            # Prepare form data; list values are sent as repeated fields
+            data = {
+                'title': title,
+                'created': self._today
+            }
+
+            # Add optional fields
+            if document_type:
+                data['document_type'] = str(document_type)
+            if correspondent:
+                data['correspondent'] = str(correspondent)
+            if tags:
+                data['tags'] = [str(tag) for tag in tags]
+
+            for attempt in range(RETRY_TOTAL + 1):
+                file_obj.seek(0)
+                files = {
+                    'document': (filename, file_obj, 'image/jpeg')
+                }
+
+                async with sem:
+                    if limiter:
+                        await limiter.acquire()
+                    response = await client.post(self.upload_endpoint, data=data, files=files)
+
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
                     print(f"Upload failed: {response.status_code} - {response.text}")
                     return None
 
+                # Back off outside the semaphore so other uploads keep going
+                await asyncio.sleep(_retry_delay(response.headers.get('Retry-After'), attempt))
+
         except Exception as e:
             print(f"Error uploading document: {str(e)}")
             return None
@@ -129,19 +312,77 @@ class PaperlessNGXUploader:
     def check_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Check the status of a consumption task"""
         try:
-            response = requests.get(
-                f"{self.tasks_endpoint}?task_id={task_id}",
-                headers=self.headers
-            )
+            response = self.session.get(self.tasks_endpoint, params={'task_id': task_id})
             if response.status_code == 200:
-                data = response.json()
-                if data.get('results'):
-                    return data['results'][0]
+                tasks = _task_results(response.json())
+                return next((task for task in tasks if task.get('task_id') == task_id), None)
             return None
         except Exception as e:
             print(f"Error checking task status: {str(e)}")
             return None
 
+    def check_task_statuses(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Check the status of several consumption tasks with a single request
+
+        Args:
+            task_ids: Task IDs returned by the upload endpoint
+
+        Returns:
+            Mapping of task ID to task data for every task that was found
+        """
+        statuses = {}
+        if not task_ids:
+            return statuses
+        try:
+            response = self.session.get(self.tasks_endpoint,
+                                        params={'task_id__in': ','.join(task_ids)})
+            if response.status_code == 200:
+                tasks = _task_results(response.json())
+                # Servers that ignore the filter return unrelated tasks too
+                wanted = set(task_ids)
+                statuses = {task['task_id']: task for task in tasks
+                            if task.get('task_id') in wanted}
+        except Exception as e:
+            print(f"Error checking task statuses: {str(e)}")
+
+        # Look up anything the bulk query rejected, ignored or paged away
+        for task_id in task_ids:
+            if task_id not in statuses:
+                task = self.check_task_status(task_id)
+                if task:
+                    statuses[task_id] = task
+        return statuses
+
+    def get_document_titles(self) -> Set[str]:
+        """
+        Fetch the titles of all documents already stored in Paperless-NGX
+
+        Pages through the documents endpoint requesting only the id and
+        title fields, so one pass over the whole archive stays cheap.
+
+        Returns:
+            Set of existing document titles (empty if the lookup failed)
+        """
+        titles = set()
+        url = self.documents_endpoint
+        params = {'fields': 'id,title', 'page_size': 1000}
+        try:
+            while url:
+                response = self.session.get(url, params=params)
+                if response.status_code != 200:
+                    print(f"✗ Failed to list existing documents: {response.status_code}")
+                    return set()
+                data = response.json()
+                titles.update(doc['title'] for doc in data.get('results', []))
+                # 'next' already carries the query string
+                url = data.get('next')
+                params = None
+        except Exception as e:
+            print(f"Error listing existing documents: {str(e)}")
+            return set()
+        return titles
+
 def create_tags_for_dataset(uploader: PaperlessNGXUploader) -> Dict[str, int]:
     """Create relevant tags for the German handwriting dataset"""
     tags_to_create = [
@@ -162,79 +403,165 @@ def create_tags_for_dataset(uploader: PaperlessNGXUploader) -> Dict[str, int]:
 
     return created_tags
 
-def process_handwriting_dataset(paperless_url: str, token: str, max_documents: int = 100,
-                              start_index: int = 0, document_type: int = None,
-                              correspondent: int = None, batch_size: int = 10):
+def _init_encoder():
+    """Register PIL's image plugins once per encoder worker process"""
+    Image.init()
+
+@lru_cache(maxsize=8)
+def _white_background(size: Tuple[int, int]) -> Image.Image:
+    """Return a reusable RGB canvas of the given size, cached per worker"""
+    return Image.new('RGB', size, (255, 255, 255))
+
+def _to_jpeg_mode(image: Image.Image) -> Image.Image:
     """
-    Process the fhswf German handwriting dataset and upload to Paperless-NGX
+    Convert an image to a mode JPEG can store, skipping work where possible
+
+    RGB and L images are returned untouched. Images with an alpha channel
+    are flattened onto a pooled white canvas, so the result is only valid
+    until the next call with the same size.
+    """
+    if image.mode in ('RGB', 'L'):
+        return image
+
+    if image.mode == 'P':
+        return image.convert('RGB')
+
+    if image.mode in ('RGBA', 'LA'):
+        # Convert RGBA/LA to RGB on a cleared, reused canvas
+        background = _white_background(image.size)
+        background.paste((255, 255, 255), (0, 0) + image.size)
+        if image.mode == 'RGBA':
+            background.paste(image, mask=image.split()[-1])
+        else:
+            background.paste(image)
+        return background
+
+    return image
+
+def _encode(raw: bytes, size: Tuple[int, int], mode: str, palette: list = None,
+            quality: int = 85, subsampling: int = 2) -> bytes:
+    """
+    Rebuild a raw PIL raster and encode it as JPEG
+
+    Runs inside a ProcessPoolExecutor worker so encoding doesn't hold the GIL
+    of the process driving the uploads. Samples cross the process boundary
+    as plain bytes rather than pickled PIL images.
 
     Args:
-        paperless_url: Base URL of your Paperless-NGX instance
-        token: API token for authentication
-        max_documents: Maximum number of documents to upload
-        start_index: Starting index in the dataset
-        document_type: Document type ID to assign
-        correspondent: Correspondent ID to assign
-        batch_size: Number of documents to process in each batch
+        raw: Pixel data as returned by Image.tobytes()
+        size: Image size as (width, height)
+        mode: PIL image mode of the raw data
+        palette: Palette for mode 'P' images
+        quality: JPEG quality (1-95)
+        subsampling: Chroma subsampling (0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0)
+
+    Returns:
+        JPEG-encoded image bytes
     """
-    # Initialize the uploader
-    uploader = PaperlessNGXUploader(paperless_url, token)
+    # Wrap the received buffer instead of copying it into a new raster
+    image = Image.frombuffer(mode, size, raw, 'raw', mode, 0, 1)
+    if palette:
+        image.putpalette(palette)
 
-    # Test connection first
-    if not uploader.test_connection():
-        print("Cannot proceed without a valid connection to Paperless-NGX")
-        return False
+    image = _to_jpeg_mode(image)
 
-    print("Loading fhswf German handwriting dataset...")
-    try:
-        # Load the dataset
-        dataset = load_dataset('fhswf/german_handwriting', split='train')
+    with io.BytesIO() as buf:
+        if image.mode == 'L':
+            # Greyscale has no chroma, so libjpeg skips colour conversion entirely
+            image.save(buf, 'JPEG', quality=quality)
+        else:
+            image.save(buf, 'JPEG', quality=quality, optimize=False,
+                       progressive=False, subsampling=subsampling)
+        return buf.getvalue()
 
-        print(f"Dataset loaded successfully!")
-        print(f"Total samples in dataset: {len(dataset)}")
-        print(f"Will process {max_documents} documents starting from index {start_index}")
+def _prefetch_batches(samples: Iterable[Dict[str, Any]], batch_size: int,
+                      depth: int = 2) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Read and decode batches of samples on a background thread
+
+    At most ``depth`` batches are buffered ahead of the consumer, which
+    keeps memory bounded while dataset reads overlap with uploads.
+    """
+    done = object()
+    ready = queue.Queue(maxsize=depth)
 
-        # Create suggested tags
-        create_tags_for_dataset(uploader)
+    def produce():
+        try:
+            it = iter(samples)
+            while batch := list(islice(it, batch_size)):
+                ready.put(batch)
+            ready.put(done)
+        except Exception as e:
+            ready.put(e)
 
-        # Create a temporary directory for images
-        with tempfile.TemporaryDirectory() as temp_dir:
-            successful_uploads = 0
-            failed_uploads = 0
+    threading.Thread(target=produce, daemon=True).start()
 
-            # Process dataset in batches
-            end_index = min(start_index + max_documents, len(dataset))
+    while True:
+        item = ready.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
 
-            for i in range(start_index, end_index, batch_size):
-                batch_end = min(i + batch_size, end_index)
+async def _upload_dataset(uploader: PaperlessNGXUploader, samples: Iterable[Dict[str, Any]],
+                          start_index: int, max_documents: int,
+                          batch_size: int, concurrency: int, document_type: int = None,
+                          correspondent: int = None, jpeg_quality: int = 85,
+                          jpeg_subsampling: int = 2,
+                          rps_limit: Optional[float] = None,
+                          cache_path: str = UPLOAD_CACHE_PATH,
+                          force: bool = False,
+                          wal_dir: str = WAL_DIR,
+                          existing_titles: Optional[Set[str]] = None) -> Tuple[int, int, int]:
+    """
+    Upload dataset samples batch by batch
+
+    ``samples`` is consumed lazily, so it may be a streaming dataset; the
+    first sample is assumed to sit at ``start_index``.
+
+    Images are JPEG-encoded in a process pool and each batch's uploads run
+    concurrently. The SHA-256 of every uploaded JPEG is recorded in a shelve
+    cache at ``cache_path``, and samples already in it are skipped unless
+    ``force`` is set. If ``existing_titles`` is given, samples whose title is
+    in it are skipped before they are encoded, and the title of every sample
+    queued for upload is added to it. JPEGs whose upload fails are written
+    to ``wal_dir`` for a later retry.
+
+    Returns:
+        Tuple of (successful_uploads, failed_uploads, skipped_uploads)
+    """
+    successful_uploads = 0
+    failed_uploads = 0
+    skipped_uploads = 0
+
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(concurrency)
+    limiter = _rate_limiter(rps_limit)
+    # Workers start lazily, once the prefetch and to_thread threads are running,
+    # and forking a multi-threaded process can deadlock the child
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_encoder,
+                             mp_context=multiprocessing.get_context('spawn')) as pool, \
+            shelve.open(cache_path) as cache:
+        try:
+            batches = _prefetch_batches(samples, batch_size)
+            i = start_index
+            while batch := await asyncio.to_thread(next, batches, None):
+                batch_end = i + len(batch)
+                # Filenames stay unique through the sample index
+                batch_ts = datetime.now().strftime("%Y%m%d_%H%M%S")
                 print(f"\nProcessing batch {i//batch_size + 1}: documents {i+1} to {batch_end}")
 
-                for j in range(i, batch_end):
+                jobs = []
+                for j, sample in enumerate(batch, start=i):
                     try:
-                        sample = dataset[j]
-
                         # Get the image and text
                         image = sample['image']  # PIL Image
                         text = sample.get('text', '').strip()
 
                         # Create a meaningful filename and title
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        filename = f"german_handwriting_{j+1:05d}_{timestamp}.jpg"
-                        temp_image_path = os.path.join(temp_dir, filename)
-
-                        # Save image as JPEG
-                        if image.mode in ('RGBA', 'LA'):
-                            # Convert RGBA/LA to RGB
-                            background = Image.new('RGB', image.size, (255, 255, 255))
-                            if image.mode == 'RGBA':
-                                background.paste(image, mask=image.split()[-1])
-                            else:
-                                background.paste(image)
-                            image = background
-
-                        image.save(temp_image_path, 'JPEG', quality=95)
-
-                        # Create a meaningful title
+                        filename = f"german_handwriting_{j+1:05d}_{batch_ts}.jpg"
+
                         if text and len(text) > 0:
                             # Use first few words as title, max 100 chars
                             words = text.split()[:10]
@@ -244,58 +571,345 @@ def process_handwriting_dataset(paperless_url: str, token: str, max_documents: i
                         else:
                             title = f"German Handwriting Sample {j+1:05d}"
 
-                        # Upload to Paperless-NGX
-                        result = uploader.upload_document(
-                            file_path=temp_image_path,
-                            title=title,
-                            text_content=text,
+                        # Skip documents Paperless-NGX (or this run) already holds
+                        if existing_titles is not None:
+                            if title in existing_titles:
+                                skipped_uploads += 1
+                                print(f"- Skipped (already in Paperless-NGX): {title[:50]}...")
+                                continue
+                            existing_titles.add(title)
+
+                        # Encode image as JPEG in a worker process
+                        future = loop.run_in_executor(
+                            pool, _encode, image.tobytes(), image.size, image.mode,
+                            image.getpalette() if image.mode == 'P' else None,
+                            jpeg_quality, jpeg_subsampling
+                        )
+                        jobs.append((j, filename, title, future))
+
+                    except Exception as e:
+                        print(f"✗ Error processing sample {j+1}: {str(e)}")
+                        failed_uploads += 1
+
+                encoded = await asyncio.gather(*[future for *_, future in jobs],
+                                               return_exceptions=True)
+
+                # Upload the encoded batch; the buffers stay open until it has been sent
+                with ExitStack() as stack:
+                    pending = []
+                    for (j, filename, title, _), data in zip(jobs, encoded):
+                        if isinstance(data, Exception):
+                            print(f"✗ Error processing sample {j+1}: {str(data)}")
+                            failed_uploads += 1
+                            continue
+
+                        # Skip samples a previous run already uploaded
+                        digest = hashlib.sha256(data).hexdigest()
+                        if not force and digest in cache:
+                            skipped_uploads += 1
+                            print(f"- Skipped (already uploaded): {title[:50]}...")
+                            continue
+
+                        # httpx streams the buffer itself in chunks, so the
+                        # JPEG is never copied into a second multipart body
+                        buf = stack.enter_context(io.BytesIO(data))
+                        pending.append((j, buf, filename, title, digest))
+
+                    # Upload to Paperless-NGX
+                    results = await asyncio.gather(*[
+                        uploader._upload_one(
+                            sem, buf, filename, title,
                             document_type=document_type,
-                            correspondent=correspondent
+                            correspondent=correspondent,
+                            limiter=limiter
                         )
+                        for _, buf, filename, title, _ in pending
+                    ])
 
+                    for (j, buf, filename, title, digest), result in zip(pending, results):
                         if result:
                             successful_uploads += 1
                             task_id = result
+                            cache[digest] = task_id
                             print(f"✓ Uploaded: {title[:50]}... (Task: {task_id})")
                         else:
                             failed_uploads += 1
-                            print(f"✗ Failed: {title[:50]}...")
-
-                        # Small delay to avoid overwhelming the server
-                        time.sleep(0.1)
-
-                    except Exception as e:
-                        print(f"✗ Error processing sample {j+1}: {str(e)}")
-                        failed_uploads += 1
-                        continue
+                            _wal_append(wal_dir, j, filename, title, buf.getvalue(), digest)
+                            print(f"✗ Failed: {title[:50]}... (queued in {wal_dir})")
 
                 # Progress update after each batch
-                total_processed = successful_uploads + failed_uploads
+                total_processed = successful_uploads + failed_uploads + skipped_uploads
                 print(f"Batch completed. Progress: {total_processed}/{max_documents} "
-                      f"(Success: {successful_uploads}, Failed: {failed_uploads})")
+                      f"(Success: {successful_uploads}, Failed: {failed_uploads}, "
+                      f"Skipped: {skipped_uploads})")
+                i = batch_end
+        finally:
+            await uploader.aclose()
+
+    return successful_uploads, failed_uploads, skipped_uploads
 
-                # Brief pause between batches
-                if batch_end < end_index:
-                    time.sleep(1)
+def _wal_append(wal_dir: str, index: int, filename: str, title: str, data: bytes,
+                digest: str):
+    """Persist a failed upload's JPEG and queue it for --retry-wal"""
+    os.makedirs(wal_dir, exist_ok=True)
+    path = os.path.join(wal_dir, f"{index}.jpg")
+    with open(path, 'wb') as file:
+        file.write(data)
+    with open(os.path.join(wal_dir, WAL_QUEUE), 'a', encoding='utf-8') as queue_file:
+        queue_file.write(json.dumps({'i': index, 'title': title, 'filename': filename,
+                                     'path': path, 'sha256': digest}) + '\n')
+
+def _read_wal(wal_dir: str) -> List[Dict[str, Any]]:
+    """Load queued failed uploads, keeping the latest entry per sample index"""
+    queue_path = os.path.join(wal_dir, WAL_QUEUE)
+    if not os.path.exists(queue_path):
+        return []
+    entries = {}
+    with open(queue_path, encoding='utf-8') as queue_file:
+        for line in queue_file:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry['i']] = entry
+    return list(entries.values())
+
+def _rewrite_wal(wal_dir: str, entries: List[Dict[str, Any]]):
+    """Replace the WAL queue with ``entries``, removing it once empty"""
+    queue_path = os.path.join(wal_dir, WAL_QUEUE)
+    if not entries:
+        os.remove(queue_path)
+        return
+    tmp_path = queue_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as queue_file:
+        for entry in entries:
+            queue_file.write(json.dumps(entry) + '\n')
+    os.replace(tmp_path, queue_path)
+
+async def _retry_wal(uploader: PaperlessNGXUploader, entries: List[Dict[str, Any]],
+                     batch_size: int, concurrency: int, document_type: int = None,
+                     correspondent: int = None, rps_limit: Optional[float] = None,
+                     cache_path: str = UPLOAD_CACHE_PATH) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Re-upload queued failures from the WAL
+
+    Returns:
+        The entries that still failed, and how many were skipped as already uploaded
+    """
+    remaining = []
+    skipped = 0
+
+    sem = asyncio.Semaphore(concurrency)
+    limiter = _rate_limiter(rps_limit)
+    with shelve.open(cache_path) as cache:
+        try:
+            for i in range(0, len(entries), batch_size):
+                uploaded = []
+                # Upload straight from the open files; httpx streams them in chunks
+                with ExitStack() as stack:
+                    batch = []
+                    files = []
+                    for entry in entries[i:i + batch_size]:
+                        if entry['sha256'] in cache:
+                            # Uploaded since it was queued (e.g. by a later run)
+                            skipped += 1
+                            uploaded.append(entry['path'])
+                            print(f"- Skipped (already uploaded): {entry['title'][:50]}...")
+                            continue
+                        try:
+                            files.append(stack.enter_context(open(entry['path'], 'rb')))
+                            batch.append(entry)
+                        except OSError as e:
+                            # Keep it queued so a restored file can be retried later
+                            remaining.append(entry)
+                            print(f"✗ Cannot read {entry['path']}: {str(e)}")
+
+                    results = await asyncio.gather(*[
+                        uploader._upload_one(
+                            sem, file, entry['filename'], entry['title'],
+                            document_type=document_type,
+                            correspondent=correspondent,
+                            limiter=limiter
+                        )
+                        for entry, file in zip(batch, files)
+                    ])
+
+                for entry, result in zip(batch, results):
+                    if result:
+                        task_id = result
+                        cache[entry['sha256']] = task_id
+                        uploaded.append(entry['path'])
+                        print(f"✓ Uploaded: {entry['title'][:50]}... (Task: {task_id})")
+                    else:
+                        remaining.append(entry)
+                        print(f"✗ Failed: {entry['title'][:50]}...")
+
+                for path in uploaded:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        finally:
+            await uploader.aclose()
+
+    return remaining, skipped
+
+def _print_summary(successful_uploads: int, failed_uploads: int, skipped_uploads: int = 0):
+    """Print the end-of-run upload summary"""
+    print(f"\n{'='*60}")
+    print(f"UPLOAD COMPLETED")
+    print(f"{'='*60}")
+    print(f"Total documents processed: {successful_uploads + failed_uploads + skipped_uploads}")
+    print(f"Successful uploads: {successful_uploads}")
+    print(f"Failed uploads: {failed_uploads}")
+    print(f"Skipped (already uploaded): {skipped_uploads}")
+    if successful_uploads + failed_uploads > 0:
+        print(f"Success rate: {(successful_uploads/(successful_uploads + failed_uploads)*100):.1f}%")
+
+    if failed_uploads > 0:
+        print(f"\nFailed uploads were saved to {WAL_DIR}/; rerun with --retry-wal to retry them.")
+
+    if successful_uploads > 0:
+        print(f"\nDocuments should appear in your Paperless-NGX instance shortly.")
+        print(f"Check the Tasks page in Paperless-NGX for consumption status.")
+
+def process_handwriting_dataset(paperless_url: str, token: str, max_documents: int = 100,
+                              start_index: int = 0, document_type: int = None,
+                              correspondent: int = None, batch_size: int = 10,
+                              concurrency: int = 8, streaming: bool = True,
+                              jpeg_quality: int = 85, jpeg_subsampling: int = 2,
+                              rps_limit: Optional[float] = None, force: bool = False,
+                              skip_existing_titles: bool = False):
+    """
+    Process the fhswf German handwriting dataset and upload to Paperless-NGX
+
+    Args:
+        paperless_url: Base URL of your Paperless-NGX instance
+        token: API token for authentication
+        max_documents: Maximum number of documents to upload
+        start_index: Starting index in the dataset
+        document_type: Document type ID to assign
+        correspondent: Correspondent ID to assign
+        batch_size: Number of documents to process in each batch
+        concurrency: Maximum number of uploads in flight at once
+        streaming: Stream samples from the Hub instead of downloading the whole dataset
+        jpeg_quality: JPEG quality used when encoding samples
+        jpeg_subsampling: JPEG chroma subsampling (0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0)
+        rps_limit: Optional cap on upload requests per second
+        force: Upload samples even if the local cache says they were already uploaded
+        skip_existing_titles: Skip samples whose title matches a document already in Paperless-NGX
+    """
+    # Initialize the uploader
+    uploader = PaperlessNGXUploader(paperless_url, token, max_connections=concurrency)
+
+    try:
+        # Test connection first
+        if not uploader.test_connection():
+            print("Cannot proceed without a valid connection to Paperless-NGX")
+            return False
+
+        print("Loading fhswf German handwriting dataset...")
+        try:
+            # Load the dataset; when streaming, only the requested slice is fetched
+            dataset = load_dataset('fhswf/german_handwriting', split='train',
+                                   streaming=streaming)
+
+            print(f"Dataset loaded successfully!")
+            if not streaming:
+                print(f"Total samples in dataset: {len(dataset)}")
+            print(f"Will process {max_documents} documents starting from index {start_index}")
+
+            # Create suggested tags
+            create_tags_for_dataset(uploader)
+
+            # Titles come from the transcription, so distinct samples can share
+            # one; matching on them is opt-in. Look them up once up front.
+            existing_titles = None
+            if skip_existing_titles:
+                existing_titles = uploader.get_document_titles()
+                print(f"Found {len(existing_titles)} existing document titles in Paperless-NGX")
+
+            # skip() drops leading samples before they are decoded. A map-style
+            # dataset's take() fails past the end, so clamp it to what's left.
+            if not streaming:
+                max_documents = max(0, min(max_documents, len(dataset) - start_index))
+            samples = dataset.skip(start_index).take(max_documents)
+
+            # Process dataset in batches
+            successful_uploads, failed_uploads, skipped_uploads = asyncio.run(_upload_dataset(
+                uploader, samples,
+                start_index=start_index,
+                max_documents=max_documents,
+                batch_size=batch_size,
+                concurrency=concurrency,
+                document_type=document_type,
+                correspondent=correspondent,
+                jpeg_quality=jpeg_quality,
+                jpeg_subsampling=jpeg_subsampling,
+                rps_limit=rps_limit,
+                force=force,
+                existing_titles=existing_titles
+            ))
 
             # Final summary
-            print(f"\n{'='*60}")
-            print(f"UPLOAD COMPLETED")
-            print(f"{'='*60}")
-            print(f"Total documents processed: {successful_uploads + failed_uploads}")
-            print(f"Successful uploads: {successful_uploads}")
-            print(f"Failed uploads: {failed_uploads}")
-            print(f"Success rate: {(successful_uploads/(successful_uploads + failed_uploads)*100):.1f}%")
+            _print_summary(successful_uploads, failed_uploads, skipped_uploads)
 
-            if successful_uploads > 0:
-                print(f"\nDocuments should appear in your Paperless-NGX instance shortly.")
-                print(f"Check the Tasks page in Paperless-NGX for consumption status.")
+            return successful_uploads > 0 or (skipped_uploads > 0 and failed_uploads == 0)
 
-            return successful_uploads > 0
+        except Exception as e:
+            print(f"Error loading or processing dataset: {str(e)}")
+            return False
+    finally:
+        uploader.close()
 
-    except Exception as e:
-        print(f"Error loading or processing dataset: {str(e)}")
-        return False
+def retry_failed_uploads(paperless_url: str, token: str, document_type: int = None,
+                         correspondent: int = None, batch_size: int = 10,
+                         concurrency: int = 8, rps_limit: Optional[float] = None,
+                         wal_dir: str = WAL_DIR):
+    """
+    Retry uploads queued in the write-ahead log without touching the dataset
+
+    Args:
+        paperless_url: Base URL of your Paperless-NGX instance
+        token: API token for authentication
+        document_type: Document type ID to assign
+        correspondent: Correspondent ID to assign
+        batch_size: Number of documents to process in each batch
+        concurrency: Maximum number of uploads in flight at once
+        rps_limit: Optional cap on upload requests per second
+        wal_dir: Directory holding the failed uploads
+    """
+    entries = _read_wal(wal_dir)
+    if not entries:
+        print(f"No failed uploads queued in {wal_dir}/")
+        return True
+
+    uploader = PaperlessNGXUploader(paperless_url, token, max_connections=concurrency)
+
+    try:
+        if not uploader.test_connection():
+            print("Cannot proceed without a valid connection to Paperless-NGX")
+            return False
+
+        print(f"Retrying {len(entries)} failed uploads from {wal_dir}/...")
+        try:
+            remaining, skipped = asyncio.run(_retry_wal(
+                uploader, entries,
+                batch_size=batch_size,
+                concurrency=concurrency,
+                document_type=document_type,
+                correspondent=correspondent,
+                rps_limit=rps_limit
+            ))
+            _rewrite_wal(wal_dir, remaining)
+
+            _print_summary(len(entries) - len(remaining) - skipped, len(remaining), skipped)
+
+            return not remaining
+
+        except Exception as e:
+            print(f"Error retrying failed uploads: {str(e)}")
+            return False
+    finally:
+        uploader.close()
 
 def main():
     parser = argparse.ArgumentParser(
@@ -306,6 +920,7 @@ Examples:
   python %(prog)s --url http://localhost:8000 --token your_token_here
   python %(prog)s --url https://paperless.example.com --token abc123 --max 25
   python %(prog)s --url http://localhost:8000 --token abc123 --start 100 --max 50
+  python %(prog)s --url http://localhost:8000 --token abc123 --retry-wal
         """
     )
 
@@ -323,6 +938,24 @@ Examples:
                        help='Correspondent ID to assign to uploaded documents')
     parser.add_argument('--batch-size', type=int, default=10,
                        help='Batch size for processing (default: 10)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                       help='Maximum number of concurrent uploads (default: 8)')
+    parser.add_argument('--rps-limit', type=float,
+                       help='Maximum upload requests per second (default: unlimited)')
+    parser.add_argument('--jpeg-quality', type=int, default=85,
+                       help='JPEG quality for uploaded images, 1-95 (default: 85)')
+    parser.add_argument('--jpeg-subsampling', type=int, choices=[0, 1, 2], default=2,
+                       help='JPEG chroma subsampling: 0=4:4:4, 1=4:2:2, 2=4:2:0 (default: 2)')
+    parser.add_argument('--force', action='store_true',
+                       help='Upload samples even if the local cache says they were already uploaded')
+    parser.add_argument('--skip-existing-titles', action='store_true',
+                       help='Skip samples whose title matches a document already in Paperless-NGX '
+                            '(samples with the same text share a title)')
+    parser.add_argument('--no-streaming', dest='streaming', action='store_false',
+                       help='Download the full dataset instead of streaming the requested samples')
+    parser.add_argument('--retry-wal', action='store_true',
+                       help=f'Retry uploads that failed in earlier runs (queued in {WAL_DIR}/) '
+                            'instead of processing the dataset')
     parser.add_argument('--dry-run', action='store_true',
                        help='Test connection and show what would be uploaded without uploading')
 
@@ -341,6 +974,18 @@ Examples:
         print("Error: --start must be non-negative")
         sys.exit(1)
 
+    if args.concurrency <= 0:
+        print("Error: --concurrency must be a positive number")
+        sys.exit(1)
+
+    if args.rps_limit is not None and args.rps_limit <= 0:
+        print("Error: --rps-limit must be a positive number")
+        sys.exit(1)
+
+    if not 1 <= args.jpeg_quality <= 95:
+        print("Error: --jpeg-quality must be between 1 and 95")
+        sys.exit(1)
+
     # Display configuration
     print("fhswf German Handwriting Dataset → Paperless-NGX Uploader")
     print("=" * 60)
@@ -349,17 +994,28 @@ Examples:
     print(f"Documents to process: {args.max}")
     print(f"Starting index: {args.start}")
     print(f"Batch size: {args.batch_size}")
+    print(f"Concurrency: {args.concurrency}")
+    if args.rps_limit:
+        print(f"Rate limit: {args.rps_limit} requests/second")
+    print(f"Streaming: {'Yes' if args.streaming else 'No'}")
+    print(f"JPEG quality: {args.jpeg_quality} (subsampling: {args.jpeg_subsampling})")
     if args.document_type:
         print(f"Document type ID: {args.document_type}")
     if args.correspondent:
         print(f"Correspondent ID: {args.correspondent}")
+    print(f"Force re-upload: {'Yes' if args.force else 'No'}")
+    print(f"Skip existing titles: {'Yes' if args.skip_existing_titles else 'No'}")
     print(f"Dry run: {'Yes' if args.dry_run else 'No'}")
     print()
 
     if args.dry_run:
         print("DRY RUN MODE: Testing connection only...")
         uploader = PaperlessNGXUploader(args.url, args.token)
-        if uploader.test_connection():
+        try:
+            connected = uploader.test_connection()
+        finally:
+            uploader.close()
+        if connected:
             print("✓ Connection test successful!")
             print("✓ Ready to upload documents (remove --dry-run to proceed)")
         else:
@@ -367,9 +1023,34 @@ Examples:
             sys.exit(1)
         return
 
+    if args.retry_wal:
+        response = input(f"Retry failed uploads queued in {WAL_DIR}/? (y/N): ")
+        if response.lower() != 'y':
+            print("Operation cancelled.")
+            sys.exit(0)
+
+        success = retry_failed_uploads(
+            paperless_url=args.url,
+            token=args.token,
+            document_type=args.document_type,
+            correspondent=args.correspondent,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            rps_limit=args.rps_limit
+        )
+        if success:
+            print("\nRetry completed successfully!")
+            sys.exit(0)
+        else:
+            print("\nSome uploads failed again; they remain queued for the next retry.")
+            sys.exit(1)
+
     # Confirm before proceeding
     print("This script will:")
-    print("1. Download the fhswf German handwriting dataset from Hugging Face")
+    if args.streaming:
+        print("1. Stream the requested samples of the fhswf German handwriting dataset from Hugging Face")
+    else:
+        print("1. Download the fhswf German handwriting dataset from Hugging Face")
     print("2. Convert handwriting images to JPEG format")
     print("3. Upload each image as a document to your Paperless-NGX instance")
     print("4. Use handwriting text content as document titles")
@@ -388,7 +1069,14 @@ Examples:
         start_index=args.start,
         document_type=args.document_type,
         correspondent=args.correspondent,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        streaming=args.streaming,
+        jpeg_quality=args.jpeg_quality,
+        jpeg_subsampling=args.jpeg_subsampling,
+        rps_limit=args.rps_limit,
+        force=args.force,
+        skip_existing_titles=args.skip_existing_titles
     )
 
     if success: